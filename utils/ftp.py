@@ -10,26 +10,149 @@
    - Get full list of accessible folders and files
    - Check folder & file creation & deletion rights
    - Check maximum rights in root folder (000 -> 777)
+   - Do all checks at the same time (asyncio)
 """
 __author__ = 'Quentin Comte-Gaz'
 __email__ = "quentin@comte-gaz.com"
 __license__ = "MIT License"
 __copyright__ = "Copyright Quentin Comte-Gaz (2016)"
-__python_version__ = "2.7+ and 3.+"
+__python_version__ = "3.7+"
 __version__ = "0.1 (2016/08/18)"
 __status__ = "Usable for all projects"
 
+import array
+import asyncio
+import concurrent.futures
 import ftplib
 import logging
-import time
+import queue
+import re
+import secrets
+import socket
+import threading
 
-import random
+# Type ('-': file, 'd': folder) and owner/group/other rights ("rwx") at the beginning of a 'DIR' line
+_RIGHTS_REGEX = re.compile(br'([-d])([-r][-w][-xXsStT])([-r][-w][-xXsStT])([-r][-w][-xXsStT])')
 
-# Import StringIO (compatible with 2.7+ and 3.+)
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
+# Unix right digit (0 -> 7) of every possible right characters ("rwx")
+_RIGHTS_DIGITS = dict(((read + write + execute).encode(), (read == 'r') * 4 + (write == 'w') * 2 + (execute in 'xXs'))
+                      for read in '-r' for write in '-w' for execute in '-xXsStT')
+
+
+class _MaxFilesReached(Exception):
+  """Maximum number of files to scan reached (stops the content scan)"""
+
+
+class ftpConnectionPool:
+  """Pool of FTP connections logged in the same FTP server
+
+  Note: Connections are only created when all connections are in use, and the
+        FTP server may limit the number of simultaneous connexions (the pool
+        will then contain less connections than requested)
+  """
+  def __init__(self, ip, port = 21, timeout = 5, login = "anonymous", password = "anonymous@",
+               size = 4, ftp_instance = None):
+    """Create the pool (no connection is created yet)
+
+    Keyword arguments:
+      ip -- (string) Server IP
+      port -- (int, optional) Port for FTP protocol
+      timeout -- (int, optional) Maximum time to wait server to answer connexion query
+      login -- (string, optional) Login used for all connections
+      password -- (string, optional) Password associated with {login}
+      size -- (int, optional) Maximum number of connections in the pool
+      ftp_instance -- (ftplib.FTP, optional) Already logged connection to add in the pool
+                      (it will not be closed by close())
+    """
+    self.ip = ip
+    self.port = port
+    self.timeout = timeout
+    self.login = login
+    self.password = password
+    self.max_size = max(size, 1)
+    self.nbr_of_instances = 0
+    self.can_grow = True
+    self.created_instances = []
+    self.available_instances = queue.Queue()
+    self.lock = threading.Lock()
+
+    if ftp_instance is not None:
+      self.nbr_of_instances = 1
+      self.available_instances.put(ftp_instance)
+
+
+  def size(self):
+    """Get the maximum number of connections in the pool
+
+    return: (int) Maximum number of connections
+    """
+    return self.max_size
+
+
+  def acquire(self):
+    """Get a connection from the pool (new connection if all are in use, else wait until one is available)
+
+    return: (ftplib.FTP) Logged connection (release() must be called once not used anymore)
+    """
+    try:
+      return self.available_instances.get_nowait()
+    except queue.Empty:
+      pass
+
+    with self.lock:
+      must_grow = self.can_grow and self.nbr_of_instances < self.max_size
+      if must_grow:
+        self.nbr_of_instances = self.nbr_of_instances + 1
+
+    if must_grow:
+      new_instance = ftplib.FTP()
+      try:
+        new_instance.connect(self.ip, self.port, self.timeout)
+        new_instance.login(self.login, self.password)
+      except Exception:
+        # No more connexion allowed by the server
+        new_instance.close()
+        with self.lock:
+          self.nbr_of_instances = self.nbr_of_instances - 1
+          self.can_grow = False
+          if self.nbr_of_instances <= 0:
+            raise ftplib.error_temp("Impossible to open a connection to the FTP server")
+      else:
+        with self.lock:
+          self.created_instances.append(new_instance)
+        return new_instance
+
+    return self.available_instances.get()
+
+
+  def release(self, ftp_instance):
+    """Give back a connection to the pool
+
+    Keyword arguments:
+      ftp_instance -- (ftplib.FTP) Connection given by acquire()
+    """
+    self.available_instances.put(ftp_instance)
+
+
+  def reconnect(self, ftp_instance):
+    """Connect and login again a connection of the pool (after connexion lost)
+
+    Keyword arguments:
+      ftp_instance -- (ftplib.FTP) Connection given by acquire()
+    """
+    ftp_instance.close()
+    ftp_instance.connect(self.ip, self.port, self.timeout)
+    ftp_instance.login(self.login, self.password)
+
+
+  def close(self):
+    """Disconnect all connections created by the pool"""
+    for instance in self.created_instances:
+      try:
+        instance.quit()
+      except Exception:
+        instance.close()
+    self.created_instances = []
 
 
 class ftpSecurityTest:
@@ -39,55 +162,331 @@ class ftpSecurityTest:
     self.ftp_instance = ftplib.FTP()
     self.ip = "127.0.0.1"
     self.port = 21
+    self.timeout = 5
+    self.login_name = "anonymous"
+    self.password = "anonymous@"
+    self.mlsd_supported = True
+    self.root_listing_cache = None
 
 
-  def __getContent(self, max_depth = -1, max_files = -1, optimized = True,
-                   count = -1, depth = 0):
-    """Get list of content from the FTP server (recursive)
+  def __isFolder(self, ftp_instance, path):
+    """Check if an element is a folder by going in it ('CWD' command)
+
+    Note: The current folder of {ftp_instance} is changed
+
+    Keyword arguments:
+      ftp_instance -- (ftplib.FTP) Logged connection to use
+      path -- (string) Absolute path of the element
+
+    return: (bool) Element is an accessible folder
+    """
+    try:
+      ftp_instance.cwd(path)
+    except (ftplib.error_perm, ftplib.error_temp, ftplib.error_reply, ftplib.error_proto):
+      return False
+    return True
+
+
+  def __listFolder(self, ftp_instance, path, optimized = True, root_listing = False):
+    """Get list of elements in a folder of the FTP server
 
     Keyword arguments:
+      ftp_instance -- (ftplib.FTP) Logged connection to use
+      path -- (string) Absolute path of the folder
+      optimized -- (bool, optional) Use optimized algorithm to be faster and less suspicious (but some folders not be scanned)
+      root_listing -- (bool, optional) {path} is the root folder: without MLSD, use the 'DIR' lines shared
+                      with getMaxRights() (see __getRootListing()) instead of NLST
+
+    return: ([(string, bool), ...]) List of element names with True if the element is a folder
+            (None if the folder is not accessible)
+    """
+    if self.mlsd_supported:
+      try:
+        # MLSD gives the type of every element in one reply (no need to 'cwd'
+        # in every element to know if it is a folder)
+        # Note: 'type' is a default fact (no 'OPTS MLST' command needed)
+        entries = list(ftp_instance.mlsd(path))
+      except ftplib.error_perm as e:
+        if not str(e).startswith('50'):
+          # Folder not accessible
+          return None
+        # MLSD command not implemented by the server, use NLST instead
+        self.mlsd_supported = False
+      else:
+        elements = []
+        folder_path = path.rstrip('/') + '/'
+        for name, facts in entries:
+          entry_type = facts.get('type', '').lower()
+          if entry_type in ('cdir', 'pdir') or name in ('.', '..'):
+            continue
+          if entry_type.startswith('os.unix=sl') or entry_type.startswith('os.unix=symlink'):
+            # Link ("OS.unix=slink:target"), it may target a folder
+            is_folder = self.__isFolder(ftp_instance, folder_path + name)
+          else:
+            is_folder = (entry_type == 'dir')
+          elements.append((name, is_folder))
+        return elements
+
+    if root_listing:
+      try:
+        elements = self.__getElementsFromListing(self.__getRootListing(), path)
+      except (ftplib.error_perm, ftplib.error_temp, ftplib.error_reply, ftplib.error_proto):
+        # 'DIR' not allowed, use NLST instead
+        elements = None
+      if elements is not None:
+        return elements
+
+    elements = []
+    folder_path = path.rstrip('/') + '/'
+    for entry in ftp_instance.nlst(path):
+      name = entry.rpartition('/')[2]
+      if name in ('.', '..'):
+        continue
+      is_folder = False
+      # Try to do go in the supposed folder only if the name doesn't seems
+      # to be a file (First char is a dot or no dot at all -> is most likely a folder)
+      # THIS IS NOT A PERFECT SOLUTION since the script may miss folders BUT
+      # it prevents numerous useless calls to the ftp server AND there is no
+      # fast, clean and universal way to check if the specific element is a
+      # file or a folder.
+      # This will HIGHLY optimize the time to grab elements and will make the
+      # script less suspicious from server point of view.
+      if (not optimized) or name.startswith('.') or '.' not in name:
+        is_folder = self.__isFolder(ftp_instance, folder_path + name)
+      elements.append((name, is_folder))
+
+    return elements
+
+
+  def __scanFolder(self, pool, path, optimized = True):
+    """Get list of elements in a folder of the FTP server with a connection of the pool
+
+    Keyword arguments:
+      pool -- (ftpConnectionPool) Pool of logged connections
+      path -- (string) Absolute path of the folder
+      optimized -- (bool, optional) Use optimized algorithm to be faster and less suspicious (but some folders not be scanned)
+
+    return: ([(string, bool), ...]) List of element names with True if the element is a folder
+            (None if the folder is not accessible)
+    """
+    ftp_instance = pool.acquire()
+    try:
+      try:
+        return self.__listFolder(ftp_instance, path, optimized)
+      except (socket.error, EOFError):
+        # Connexion lost, connect again and retry once
+        pool.reconnect(ftp_instance)
+        return self.__listFolder(ftp_instance, path, optimized)
+    except (ftplib.error_perm, ftplib.error_temp, ftplib.error_reply, ftplib.error_proto):
+      # Folder not accessible (or empty folder for some servers), the scan goes on with other folders
+      return None
+    finally:
+      pool.release(ftp_instance)
+
+
+  def __getRootListing(self):
+    """Get the 'DIR' lines of the root folder (only asked once to the server)
+
+    Note: The listing is received in binary mode in one buffer (no decoding of every line)
+
+    return: ([bytes, ...]) Lines of the 'DIR' command
+    """
+    if self.root_listing_cache is None:
+      data = bytearray()
+      self.ftp_instance.retrbinary("LIST", data.extend)
+      self.root_listing_cache = bytes(data).splitlines()
+    return self.root_listing_cache
+
+
+  def __getElementsFromListing(self, listing, path):
+    """Get the list of elements from Unix style 'DIR' lines ("drwxr-xr-x 1 owner group 0 Jan 1 00:00 name")
+
+    Note: Links may target folders, the connection goes in every link to know it (like the NLST fallback)
+
+    Keyword arguments:
+      listing -- ([bytes, ...]) Lines of the 'DIR' command
+      path -- (string) Absolute path of the listed folder
+
+    return: ([(string, bool), ...]) List of element names with True if the element is a folder
+            (None if the lines are not Unix style lines)
+    """
+    elements = []
+    for line in listing:
+      if line.startswith(b"total "):
+        continue
+      fields = line.split(None, 8)
+      element_type = line[:1]
+      if len(fields) < 9 or element_type not in (b'-', b'd', b'l'):
+        return None
+      name = fields[8]
+      if element_type == b'l':
+        # Link: "name -> target"
+        name = name.split(b" -> ")[0]
+      name = name.decode(self.ftp_instance.encoding, "replace")
+      if name in ('.', '..'):
+        continue
+      if element_type == b'l':
+        is_folder = self.__isFolder(self.ftp_instance, path.rstrip('/') + '/' + name)
+      else:
+        is_folder = (element_type == b'd')
+      elements.append((name, is_folder))
+    return elements
+
+
+  def __getContent(self, pool, path, max_depth = -1, max_files = -1, optimized = True, elements = None):
+    """Get list of content from the FTP server (all connections of the pool scan folders in parallel)
+
+    Keyword arguments:
+      pool -- (ftpConnectionPool) Pool of logged connections
+      path -- (string) Absolute path of the directory to scan
       max_depth -- (int, optional) Maximum depth before stopping the scan (-1 for no limit)
       max_files -- (int, optional) Maximum number of file to scan before stopping the scan (-1 for no limit)
       optimized -- (bool, optional) Use optimized algorithm to be faster and less suspicious (but some folders not be scanned)
-      count -- (int, optional) Internal value (number of files already found)
-      depth -- (int, optional) Internal value (current depth)
+      elements -- ([(string, bool), ...], optional) Elements of the folder {path} if already known (see __listFolder())
+
+    return: ([string, ...], array('i'), bytearray) Flat content (see getContentFlat())
+    """
+    paths = []
+    parents = array.array('i')
+    types = bytearray()
+    count = 0
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers = pool.size())
+    try:
+      # Breadth-first scan: {future: (folder index (-1 for root), folder absolute path, folder depth)}
+      if elements is None:
+        first_future = executor.submit(self.__scanFolder, pool, path, optimized)
+      else:
+        # No need to list the folder again
+        first_future = concurrent.futures.Future()
+        first_future.set_result(elements)
+      pending = {first_future: (-1, path, 0)}
+      while pending:
+        done, _ = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+          folder_index, folder_path, depth = pending.pop(future)
+          folder_elements = future.result()
+          if folder_elements is None:
+            # Folder not accessible (stays marked with '+')
+            continue
+          if folder_index >= 0:
+            types[folder_index] = ord('d')
+            path_prefix = paths[folder_index] + '/'
+          else:
+            path_prefix = ''
+          first_element_index = len(paths)
+          for name, is_folder in folder_elements:
+            # max_files is never reached if negative (no limit)
+            if count == max_files:
+              raise _MaxFilesReached()
+            count = count + 1
+            paths.append(path_prefix + name)
+            parents.append(folder_index)
+            if is_folder:
+              # Folders not scanned (yet) are marked with '+'
+              types.append(ord('+'))
+              if max_depth < 0 or depth < max_depth:
+                entry_path = folder_path.rstrip('/') + '/' + name
+                pending[executor.submit(self.__scanFolder, pool, entry_path, optimized)] = \
+                  (len(paths) - 1, entry_path, depth + 1)
+            else:
+              types.append(ord('-'))
+    except _MaxFilesReached:
+      if folder_index >= 0:
+        # Folder not fully scanned: marked as not scanned, without the elements already added
+        types[folder_index] = ord('+')
+        del paths[first_element_index:]
+        del parents[first_element_index:]
+        del types[first_element_index:]
+      # No need to wait for the folders not scanned yet
+      for future in pending:
+        future.cancel()
+    finally:
+      executor.shutdown(wait = True)
+
+    return paths, parents, types
+
+
+  def __getNestedContent(self, paths, parents, types):
+    """Transform flat content (see getContentFlat()) into recursive dictionary (see getContent())
+
+    Keyword arguments:
+      paths -- ([string, ...]) Path of every element
+      parents -- (array('i')) Index of the parent folder of every element (-1 for root)
+      types -- (bytearray) Type of every element
 
     return: ({string: {...}}) Recursive dictionary containing all scanned files with folders as keys (files are keys of empty elements)
     """
-    # TODO: Improve error handling
-    if max_files >= 0:
-      count = count + 1
-      if count >= max_files:
-        return '+'
-    if max_depth >= 0 and depth > max_depth:
-      return '+'
-
-    level = {}
-    #try:
-    for entry in (path for path in self.ftp_instance.nlst() if path not in ('.', '..')):
-      entry_split = entry.split("/")
-      name = entry_split[len(entry_split) - 1]
+    content = {}
+    levels = []
+    for path, parent, element_type in zip(paths, parents, types):
+      if element_type == ord('d'):
+        level = {}
+      elif element_type == ord('+'):
+        level = '+'
+      else:
+        level = ''
+      levels.append(level)
+
+      parent_level = content if parent < 0 else levels[parent]
+      # Elements of a folder not fully scanned are ignored
+      if isinstance(parent_level, dict):
+        parent_level[path.rpartition('/')[2]] = level
+    return content
+
+
+  def __getRootContent(self, max_depth, max_files, max_connections):
+    """Get list of content from the root folder of the FTP server (see getContent())"""
+    root_path = self.ftp_instance.pwd()
+
+    pool = None
+    try:
+      # The root folder is listed first to know if MLSD is supported: without MLSD, the 'DIR'
+      # lines of the root folder are shared with getMaxRights() (MLSD is preferred since 'DIR'
+      # may hide elements, e.g. names beginning with a dot)
       try:
-        # Try to do go in the supposed folder only if the name doesn't seems
-        # to be a file (First char is a dot or no dot at all -> is most likely a folder)
-        # THIS IS NOT A PERFECT SOLUTION since the script may miss folders BUT
-        # it prevents numerous useless calls to the ftp server AND there is no
-        # fast, clean and universal way to check if the specific element is a
-        # file or a folder.
-        # This will HIGHLY optimize the time to grab elements and will make the
-        # script less suspicious from server point of view.
-        if name.find(".") <= 0 or (not optimized):
-          self.ftp_instance.cwd(entry)
-          level[name] = self.__getContent(max_depth, max_files, count, depth + 1)
-          self.ftp_instance.cwd('..')
-        else:
-          level[name] = ''
+        root_elements = self.__listFolder(self.ftp_instance, root_path, root_listing = True)
       except (ftplib.error_perm, ftplib.error_temp, ftplib.error_reply, ftplib.error_proto):
-        level[name] = ''
-    #except (ftplib.error_perm, ftplib.error_temp, ftplib.error_reply, ftplib.error_proto):
-    #  pass
+        root_elements = None
+      if root_elements is None:
+        # Root folder not accessible
+        return [], array.array('i'), bytearray()
+
+      pool = ftpConnectionPool(self.ip, self.port, self.timeout, self.login_name, self.password,
+                               max_connections, self.ftp_instance)
+      return self.__getContent(pool, root_path, max_depth, max_files, elements = root_elements)
+    finally:
+      if pool is not None:
+        pool.close()
+      # Going in links and in folders (NLST fallback) changes the current folder
+      self.ftp_instance.cwd(root_path)
+
+
+  def __runWithConnection(self, function, *args, cleanup_function = None):
+    """Call a function using the FTP connection (connect and login again if the connexion was lost)
+
+    Note: If {function} fails and the connexion is lost, {function} is called again once
+
+    Keyword arguments:
+      function -- (function) Function to call
+      args -- Arguments of {function}
+      cleanup_function -- (function, optional) Function called with {args} before calling {function}
+                          again (to undo what the failed call may have done on the server)
 
-    return level
+    return: Value returned by {function}
+    """
+    try:
+      return function(*args)
+    except ftplib.all_errors:
+      if self.keepAlive():
+        # The connexion is fine, the error is not due to the connexion
+        raise
+      if not self.connect(self.ip, self.port, self.timeout) or \
+         not self.login(self.login_name, self.password):
+        raise
+    if cleanup_function is not None:
+      cleanup_function(*args)
+    return function(*args)
 
 
   def connect(self, ip, port = 21, timeout = 5):
@@ -104,6 +503,9 @@ class ftpSecurityTest:
     """
     self.ip = ip
     self.port = port
+    self.timeout = timeout
+    self.mlsd_supported = True
+    self.root_listing_cache = None
 
     # Quit previous instance (if connect() was already called)
     self.quit()
@@ -142,6 +544,8 @@ class ftpSecurityTest:
     try:
       #Check if the FTP server is secured
       self.ftp_instance.login(login, password)
+      self.login_name = login
+      self.password = password
     except Exception:
       # Not logged in
       return False
@@ -150,6 +554,20 @@ class ftpSecurityTest:
     return True
 
 
+  def keepAlive(self):
+    """Check the connexion with the FTP server is still alive (and keep it alive)
+
+    Note: Send a 'NOOP' command, call it periodically to prevent the server from closing the connexion
+
+    return: (bool) Connexion alive
+    """
+    try:
+      self.ftp_instance.voidcmd("NOOP")
+    except ftplib.all_errors:
+      return False
+    return True
+
+
   def getWelcomeBanner(self):
     """Get the welcome banner from the server
 
@@ -160,7 +578,7 @@ class ftpSecurityTest:
     return self.ftp_instance.getwelcome()
 
 
-  def getContent(self, max_depth = -1, max_files = -1):
+  def getContent(self, max_depth = -1, max_files = -1, max_connections = 4):
     """Get list of content (files and folders) from the FTP server
 
     Note: connect() and login() must be called first
@@ -168,56 +586,145 @@ class ftpSecurityTest:
     Keyword arguments:
       max_depth -- (int, optional) Maximum depth before stopping the scan (-1 for no limit)
       max_files -- (int, optional) Maximum number of file to scan before stopping the scan (-1 for no limit)
+      max_connections -- (int, optional) Maximum number of simultaneous connections used to scan folders in parallel
 
     return: ({string: {string:string, ...}, ...) Dictionary containing all scanned files with files and folders as keys and sub-files and sub-folders as content (recursive logic)
     """
-    return self.__getContent(max_depth, max_files)
+    return self.__getNestedContent(*self.getContentFlat(max_depth, max_files, max_connections))
+
+
+  def getContentFlat(self, max_depth = -1, max_files = -1, max_connections = 4):
+    """Get list of content (files and folders) from the FTP server as flat lists (less memory than getContent())
+
+    Note: connect() and login() must be called first
+
+    Keyword arguments:
+      max_depth -- (int, optional) Maximum depth before stopping the scan (-1 for no limit)
+      max_files -- (int, optional) Maximum number of file to scan before stopping the scan (-1 for no limit)
+      max_connections -- (int, optional) Maximum number of simultaneous connections used to scan folders in parallel
+
+    return: ([string, ...], array('i'), bytearray) Path of every element (from root folder, "folder/file"),
+            index in the lists of its parent folder (-1 for root folder),
+            type of every element (b'-' file, b'd' folder, b'+' folder not scanned or not accessible)
+    """
+    return self.__runWithConnection(self.__getRootContent, max_depth, max_files, max_connections)
 
 
-  def checkWriteAndDeleteAccess(self, dir_name="folder_to_delete_"+str(random.randrange(100000000, 900000000)),
-                                filename="file_to_delete_"+str(random.randrange(100000000, 900000000))):
+  def checkWriteAndDeleteAccess(self, dir_name = None, filename = None):
     """Check write & delete access of files and folders in root directory
 
     Note: connect() and login() must be called first
 
     Keyword arguments:
-      dir_name -- (string, optional) Name of the directory to create and delete
-      filename -- (string, optional) Name of empty file to create and delete
+      dir_name -- (string, optional) Name of the directory to create and delete (random name if None)
+      filename -- (string, optional) Name of empty file to create and delete (random name if None)
 
     return: (bool, bool, bool, bool) Can create/upload dir, Can delete dir, Can create/upload file, Can delete file
     """
+    # New names for every call (no conflict with elements of a previous call)
+    if dir_name is None:
+      dir_name = "folder_to_delete_"+secrets.token_hex(8)
+    if filename is None:
+      filename = "file_to_delete_"+secrets.token_hex(8)
+
+    return self.__runWithConnection(self.__checkWriteAndDeleteAccess, dir_name, filename,
+                                    cleanup_function = self.__deleteTestElements)
+
+
+  def __getRootPermissions(self):
+    """Get the permissions given by the server on the root folder ('perm' fact of the 'MLST' command)
+
+    Note: 'MLST' gives the facts in the command answer (no data connection needed like 'MLSD')
+
+    return: (string) Permission letters (e.g. "elcdmp": 'c' -> can create files, 'm' -> can create
+            folders, ...), None if the server does not give them
+    """
+    if not self.mlsd_supported:
+      return None
+
+    try:
+      self.ftp_instance.sendcmd("OPTS MLST type;perm;")
+      answer = self.ftp_instance.sendcmd("MLST")
+    except ftplib.error_perm as e:
+      if str(e).startswith('50'):
+        # MLST commands not implemented by the server, MLSD (same RFC 3659) is not implemented too
+        self.mlsd_supported = False
+      return None
+
+    # Answer: "250-Listing /", " type=cdir;perm=elcdmp; /", "250 End."
+    for line in answer.splitlines()[1:-1]:
+      for fact in line.lstrip().partition(' ')[0].split(';'):
+        fact_name, _, fact_value = fact.partition('=')
+        if fact_name.lower() == 'perm':
+          return fact_value.lower()
+    return None
+
+
+  def __deleteTestElements(self, dir_name, filename):
+    """Delete the folder and file that may have been created by an interrupted checkWriteAndDeleteAccess()
+
+    Keyword arguments:
+      dir_name -- (string) Name of the directory to delete
+      filename -- (string) Name of the file to delete
+    """
+    try:
+      self.ftp_instance.rmd(dir_name)
+    except ftplib.all_errors:
+      # Folder not created (or not deletable)
+      pass
+    try:
+      self.ftp_instance.delete(filename)
+    except ftplib.all_errors:
+      # File not created (or not deletable)
+      pass
+
+
+  def __checkWriteAndDeleteAccess(self, dir_name, filename):
+    """Check write & delete access of files and folders in root directory (see checkWriteAndDeleteAccess())"""
     can_create_dir = False
     can_delete_dir = False
     can_upload_file = False
     can_delete_file = False
 
-    # Test directory creation and deletion
-    try:
-      self.ftp_instance.mkd(dir_name)
-    except ftplib.error_perm:
-      pass
-    else:
-      can_create_dir = True
+    # No need to try what the server already forbids
+    permissions = self.__getRootPermissions()
+
+    # Test directory creation ('m' permission) and deletion
+    if permissions is None or 'm' in permissions:
       try:
-        self.ftp_instance.rmd(dir_name)
+        self.ftp_instance.mkd(dir_name)
       except ftplib.error_perm:
         pass
       else:
-        can_delete_dir = True
+        can_create_dir = True
+        try:
+          self.ftp_instance.rmd(dir_name)
+        except ftplib.error_perm:
+          pass
+        else:
+          can_delete_dir = True
 
-    # Test file upload and deletion
-    try:
-      self.ftp_instance.storbinary("STOR "+filename, StringIO(''))
-    except ftplib.error_perm:
-      pass
-    else:
-      can_upload_file = True
+    # Test file upload ('c' permission) and deletion
+    if permissions is None or 'c' in permissions:
       try:
-        self.ftp_instance.delete(filename)
+        # Empty file: close the data connection without sending anything (no need of the
+        # 'TYPE' command and of the read loop done by storbinary())
+        self.ftp_instance.transfercmd("STOR "+filename).close()
+        self.ftp_instance.voidresp()
       except ftplib.error_perm:
         pass
       else:
-        can_delete_file = True
+        can_upload_file = True
+        try:
+          self.ftp_instance.delete(filename)
+        except ftplib.error_perm:
+          pass
+        else:
+          can_delete_file = True
+
+    if can_create_dir or can_upload_file:
+      # The root folder content was modified
+      self.root_listing_cache = None
 
     result = [can_create_dir, can_delete_dir, can_upload_file, can_delete_file]
     return result
@@ -229,15 +736,20 @@ class ftpSecurityTest:
     Note: connect() and login() must be called first
 
     return: (int, int) Dir rights, File rights (-1 if server does not contain
-            folder/file or does not accept 'DIR' cmd, else: value between 000 and 777)
+            folder/file or does not accept 'DIR' cmd, else: Unix rights between 0o000 and 0o777,
+            e.g. 0o755 -> format(rights, '03o') gives "755")
     """
-    data = []
+    return self.__runWithConnection(self.__getMaxRights)
+
+
+  def __getMaxRights(self):
+    """Get the maximum Unix rights for file and folder in root directory (see getMaxRights())"""
     is_valid_dir = False
     is_valid_file = False
 
     try:
       # Get the list of files and dir in the directory
-      self.ftp_instance.dir(data.append)
+      data = self.__getRootListing()
     except ftplib.error_perm:
       return -1, -1
 
@@ -245,89 +757,193 @@ class ftpSecurityTest:
       return -1, -1
 
     # Extract right information (000->777) from all lines
-    result_dir = [False, False, False, False, False, False, False, False, False]
-    result_file = [False, False, False, False, False, False, False, False, False]
+    mask_dir = 0
+    mask_file = 0
     for line in data:
-      if len(line) > 10:
-        # Be sure the element to check is a file ('-') or a folder ('d') and not a link
-        # (A link will always have "full right" even if it means 'nothing')
-        if line[0] == '-' or line[0] == 'd':
-          if line[0] == 'd':
-            is_valid_dir = True
-          else:
-            is_valid_file = True
-          for i in range(1, 10):
-            element = line[i]
-            right_type = i%3
-            if (element == 'r' and right_type == 1) or \
-               (element == 'w' and right_type == 2) or \
-               ((element == 'x' or element == 'X' or element == 's') and right_type == 0):
-              if line[0] == 'd':
-                result_dir[i - 1] = True
-              else:
-                result_file[i - 1] = True
+      # Be sure the element to check is a file ('-') or a folder ('d') and not a link
+      # (A link will always have "full right" even if it means 'nothing')
+      match = _RIGHTS_REGEX.match(line)
+      if match is not None and len(line) > 10:
+        element_type, owner, group, other = match.groups()
+        mask = (_RIGHTS_DIGITS[owner] << 6) | (_RIGHTS_DIGITS[group] << 3) | _RIGHTS_DIGITS[other]
+        if element_type == b'd':
+          is_valid_dir = True
+          mask_dir |= mask
+        else:
+          is_valid_file = True
+          mask_file |= mask
 
     if is_valid_dir == False and is_valid_file == False:
       return -1, -1
 
-    # Transform the table of right into integer between "000" and "777" (right)
-    if is_valid_dir:
-      rights_dir = 0
-      if result_dir[0] == True:
-        rights_dir = rights_dir + 400
-      if result_dir[1] == True:
-        rights_dir = rights_dir + 200
-      if result_dir[2] == True:
-        rights_dir = rights_dir + 100
-
-      if result_dir[3] == True:
-        rights_dir = rights_dir + 40
-      if result_dir[4] == True:
-        rights_dir = rights_dir + 20
-      if result_dir[5] == True:
-        rights_dir = rights_dir + 10
-
-      if result_dir[6] == True:
-        rights_dir = rights_dir + 4
-      if result_dir[7] == True:
-        rights_dir = rights_dir + 2
-      if result_dir[8] == True:
-        rights_dir = rights_dir + 1
-    else:
-      rights_dir = -1
-
-    if is_valid_file:
-      rights_file = 0
-      if result_file[0] == True:
-        rights_file = rights_file + 400
-      if result_file[1] == True:
-        rights_file = rights_file + 200
-      if result_file[2] == True:
-        rights_file = rights_file + 100
-
-      if result_file[3] == True:
-        rights_file = rights_file + 40
-      if result_file[4] == True:
-        rights_file = rights_file + 20
-      if result_file[5] == True:
-        rights_file = rights_file + 10
-
-      if result_file[6] == True:
-        rights_file = rights_file + 4
-      if result_file[7] == True:
-        rights_file = rights_file + 2
-      if result_file[8] == True:
-        rights_file = rights_file + 1
-    else:
-      rights_file = -1
+    rights_dir = mask_dir if is_valid_dir else -1
+    rights_file = mask_file if is_valid_file else -1
 
     return rights_dir, rights_file
 
-# Have input() function compatible with python 2+ and 3+
-try:
-  input = raw_input
-except NameError:
-  pass
+
+class ftpSecurityTestAsync:
+  """Asynchronous FTP security test class (asyncio)
+
+  Every check is done with its own connection to the FTP server so that all
+  checks can be done at the same time
+  """
+  def __init__(self, max_connections = 4):
+    """Create the asynchronous FTP security test
+
+    Keyword arguments:
+      max_connections -- (int, optional) Maximum number of connections to the FTP server opened at the same time
+    """
+    self.ftp_test = ftpSecurityTest()
+    self.max_connections = max_connections
+    self.semaphore = None
+    self.semaphore_lock = None
+
+
+  async def __run(self, function, *args):
+    """Run a blocking function in a thread without blocking the event loop
+
+    Keyword arguments:
+      function -- (function) Function to call
+      args -- Arguments of {function}
+
+    return: Value returned by {function}
+    """
+    return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+
+  async def __acquireConnections(self, nbr_of_connections):
+    """Reserve connections to the FTP server among the {max_connections} allowed
+
+    Note: Checks reserving several connections do it one at a time so that they
+          can't block each other with partially reserved connections
+
+    Keyword arguments:
+      nbr_of_connections -- (int) Number of connections to reserve
+    """
+    if self.semaphore is None:
+      self.semaphore = asyncio.BoundedSemaphore(self.max_connections)
+      self.semaphore_lock = asyncio.Lock()
+
+    if nbr_of_connections == 1:
+      await self.semaphore.acquire()
+      return
+
+    async with self.semaphore_lock:
+      for _ in range(nbr_of_connections):
+        await self.semaphore.acquire()
+
+
+  def __releaseConnections(self, nbr_of_connections):
+    """Release connections reserved with __acquireConnections()
+
+    Keyword arguments:
+      nbr_of_connections -- (int) Number of connections to release
+    """
+    for _ in range(nbr_of_connections):
+      self.semaphore.release()
+
+
+  async def __runCheck(self, check_function, *args, nbr_of_connections = 1):
+    """Run a check of ftpSecurityTest with a new connection to the FTP server
+
+    Note: If the connection to the FTP server is lost during the check, it is done again once with a new connection
+
+    Keyword arguments:
+      check_function -- (function(ftpSecurityTest, ...)) ftpSecurityTest method to call
+      args -- Arguments of {check_function}
+      nbr_of_connections -- (int, optional) Number of connections to the FTP server used by {check_function}
+
+    return: Value returned by {check_function}
+    """
+    await self.__acquireConnections(nbr_of_connections)
+    try:
+      for retry in (True, False):
+        ftp_test = ftpSecurityTest()
+        try:
+          if not await self.__run(ftp_test.connect, self.ftp_test.ip, self.ftp_test.port, self.ftp_test.timeout) or \
+             not await self.__run(ftp_test.login, self.ftp_test.login_name, self.ftp_test.password):
+            raise ftplib.error_temp("Impossible to open a new connection to the FTP server")
+          return await self.__run(check_function, ftp_test, *args)
+        except (OSError, EOFError):
+          # Connection lost (other errors are answers of the FTP server and would happen again)
+          if not retry:
+            raise
+          # Let other checks run before trying again with a new connection
+          await asyncio.sleep(0)
+        finally:
+          await self.__run(ftp_test.quit)
+    finally:
+      self.__releaseConnections(nbr_of_connections)
+
+
+  async def connect(self, ip, port = 21, timeout = 5):
+    """Connect to the FTP server (see ftpSecurityTest.connect())"""
+    return await self.__run(self.ftp_test.connect, ip, port, timeout)
+
+
+  async def quit(self):
+    """Disconnect from the FTP server"""
+    await self.__run(self.ftp_test.quit)
+
+
+  async def login(self, login = "anonymous", password = "anonymous@"):
+    """Login to the FTP server (see ftpSecurityTest.login())"""
+    return await self.__run(self.ftp_test.login, login, password)
+
+
+  def getWelcomeBanner(self):
+    """Get the welcome banner from the server (see ftpSecurityTest.getWelcomeBanner())"""
+    return self.ftp_test.getWelcomeBanner()
+
+
+  async def getContent(self, max_depth = -1, max_files = -1, max_connections = 4):
+    """Get list of content from the FTP server (see ftpSecurityTest.getContent())
+
+    Note: {max_connections} is limited to the maximum number of connections of this class
+    """
+    max_connections = max(1, min(max_connections, self.max_connections))
+    return await self.__runCheck(ftpSecurityTest.getContent, max_depth, max_files, max_connections,
+                                 nbr_of_connections = max_connections)
+
+
+  async def getContentFlat(self, max_depth = -1, max_files = -1, max_connections = 4):
+    """Get list of content from the FTP server as flat lists (see ftpSecurityTest.getContentFlat())
+
+    Note: {max_connections} is limited to the maximum number of connections of this class
+    """
+    max_connections = max(1, min(max_connections, self.max_connections))
+    return await self.__runCheck(ftpSecurityTest.getContentFlat, max_depth, max_files, max_connections,
+                                 nbr_of_connections = max_connections)
+
+
+  async def checkWriteAndDeleteAccess(self, *args):
+    """Check write & delete access in root directory (see ftpSecurityTest.checkWriteAndDeleteAccess())"""
+    return await self.__runCheck(ftpSecurityTest.checkWriteAndDeleteAccess, *args)
+
+
+  async def getMaxRights(self):
+    """Get the maximum Unix rights in root directory (see ftpSecurityTest.getMaxRights())"""
+    return await self.__runCheck(ftpSecurityTest.getMaxRights)
+
+
+  async def scan(self, max_depth = -1, max_files = -1):
+    """Check maximum rights and content of the FTP server at the same time, then write & delete access
+
+    Note: connect() and login() must be called first
+    Note: Write & delete access is checked afterwards since it creates elements in the listed root folder
+
+    Keyword arguments:
+      max_depth -- (int, optional) Maximum depth before stopping the content scan (-1 for no limit)
+      max_files -- (int, optional) Maximum number of file to scan before stopping the content scan (-1 for no limit)
+
+    return: ([bool, bool, bool, bool], (int, int), {string: {...}}) Results of checkWriteAndDeleteAccess(),
+            getMaxRights() and getContent()
+    """
+    rights, content = await asyncio.gather(self.getMaxRights(),
+                                           self.getContent(max_depth, max_files))
+    access = await self.checkWriteAndDeleteAccess()
+    return access, rights, content
 
 def main():
   """Demo of the IP utility functions"""
@@ -368,14 +984,8 @@ def main():
     try:
       create_folder, delete_folder, create_file, delete_file = ftp_test.checkWriteAndDeleteAccess()
     except ftplib.all_errors as e:
-      print("An error occurred ('"+str(e)+"'), trying again...")
-      # The error may be due to socket not released, a small delay is needed
-      time.sleep(1)
-      try:
-        create_folder, delete_folder, create_file, delete_file = ftp_test.checkWriteAndDeleteAccess()
-      except ftplib.all_errors as e:
-        operation_ok = False
-        print("Impossible to get the creation/deletion rights of the FTP server ('"+str(e)+"')...")
+      operation_ok = False
+      print("Impossible to get the creation/deletion rights of the FTP server ('"+str(e)+"')...")
 
     if operation_ok:
       print("Can create folder: "+str(create_folder))
@@ -388,40 +998,27 @@ def main():
     try:
       max_rights_dir, max_rights_file = ftp_test.getMaxRights()
     except ftplib.all_errors as e:
-      print("An error occurred ('"+str(e)+"'), trying again...")
-      # The error may be due to socket not released, a small delay is needed
-      time.sleep(1)
-      try:
-        max_rights_dir, max_rights_file = ftp_test.getMaxRights()
-      except ftplib.all_errors as e:
-        operation_ok = False
-        print("Impossible to get the max rights of the FTP server ('"+str(e)+"')...")
+      operation_ok = False
+      print("Impossible to get the max rights of the FTP server ('"+str(e)+"')...")
 
     if operation_ok:
       if max_rights_dir < 0:
         print("Max rights (folders): Server does not contain folders or operation not allowed")
       else:
-        print("Max rights (folders): "+str(max_rights_dir))
+        print("Max rights (folders): "+format(max_rights_dir, '03o'))
 
       if max_rights_file < 0:
         print("Max rights (files): Server does not contain files or operation not allowed")
       else:
-        print("Max rights (files): "+str(max_rights_file))
+        print("Max rights (files): "+format(max_rights_file, '03o'))
 
     print("\n----Get list of all accessible files and folders----")
     operation_ok = True
     try:
       content = ftp_test.getContent()
     except ftplib.all_errors as e:
-      print("An error occurred ('"+str(e)+"'), trying again...")
-      # The error may be due to socket not released, a small delay is needed
-      time.sleep(1)
-      try:
-
-        content = ftp_test.getContent()
-      except ftplib.all_errors as e:
-        operation_ok = False
-        print("Impossible to get the content of the FTP server ('"+str(e)+"')...")
+      operation_ok = False
+      print("Impossible to get the content of the FTP server ('"+str(e)+"')...")
 
     if operation_ok:
       print(content)
@@ -11,17 +11,46 @@ __author__ = 'Quentin Comte-Gaz'
 __email__ = "quentin@comte-gaz.com"
 __license__ = "MIT License"
 __copyright__ = "Copyright Quentin Comte-Gaz (2016)"
-__python_version__ = "2.7+ and 3.+"
+__python_version__ = "3.7+"
 __version__ = "1.0 (2016/08/12)"
 __status__ = "Usable for all projects"
 
 import platform
+import asyncio
+import bisect
 import socket
 import struct
 import subprocess
-import shlex
 import logging
 
+# IP range taken from https://en.wikipedia.org/wiki/Reserved_IP_addresses
+_PUBLIC_IP_RANGES = ((16777216, 167772159),   # 1.0.0.0 to 9.255.255.255
+                     (184549376, 1681915903), # 11.0.0.0 to 100.63.255.255
+                     (1686110208, 2130641151),# 100.128.0.0 to 126.255.255
+                     (2147483648, 2851995647),# 128.0.0.0 to 169.253.255.255
+                     (2852061184, 2886729727),# 169.255.0.0 to 172.15.255.255
+                     (2887778304, 3221225471),# 172.32.0.0 to 191.255.255.255
+                     (3221225728, 3221225983),# 192.0.1.0 to 192.0.1.255
+                     (3221226240, 3227017983),# 192.0.3.0 to 192.88.98.255
+                     (3227018240, 3232235519),# 192.88.100.0 to 192.167.255.255
+                     (3232301056, 3323068415),# 192.169.0.0 to 198.17.255.255
+                     (3323199488, 3325256703),# 198.20.0.0 to 198.51.99.255
+                     (3325256960, 3405803775),# 198.51.101.0 to 203.0.112.255
+                     (3405804032, 3744923903) # 203.0.114.0 to 223.55.255
+                    )
+
+# Sorted bounds of public IP ranges (first IP, last IP + 1, ...): an IP is
+# public if an odd number of bounds is lower or equal to it
+_PUBLIC_IP_BOUNDS = tuple(bound for ip_begin, ip_end in _PUBLIC_IP_RANGES for bound in (ip_begin, ip_end + 1))
+
+#Ping parameters are function of the OS (timeout in ms on windows, in sec otherwise)
+if platform.system().lower()=="windows":
+  _PING_CMD = ["ping", "-n", "1", "-w"]
+  _PING_TIMEOUT_FACTOR = 1000
+else:
+  _PING_CMD = ["ping", "-c", "1", "-W"]
+  _PING_TIMEOUT_FACTOR = 1
+
 def ipToInt(ip):
   """Transform a string IP into an integer (long)
 
@@ -30,7 +59,7 @@ def ipToInt(ip):
 
   return: (long) IP number
   """
-  return struct.unpack("!L", socket.inet_aton(ip))[0]
+  return int.from_bytes(socket.inet_aton(ip), 'big')
 
 def intToIp(n):
   """Transform an integer into the related IP
@@ -40,7 +69,29 @@ def intToIp(n):
 
   return: (string) IP as a string ("xxx.xxx.xxx.xxx")
   """
-  return socket.inet_ntoa(struct.pack('!I', n))
+  return socket.inet_ntoa(n.to_bytes(4, 'big'))
+
+def ipsToInts(ips):
+  """Transform a list of string IPs into integers (long)
+
+  Keyword arguments:
+    ips -- ([string, ...]) IPs as strings ("xxx.xxx.xxx.xxx")
+
+  return: ((long, ...)) IP numbers
+  """
+  packed_ips = b''.join(map(socket.inet_aton, ips))
+  return struct.unpack("!"+str(len(packed_ips) // 4)+"L", packed_ips)
+
+def intsToIps(ns):
+  """Transform a list of integers into the related IPs
+
+  Keyword arguments:
+    ns -- ([long, ...]) IP numbers
+
+  return: ([string, ...]) IPs as strings ("xxx.xxx.xxx.xxx")
+  """
+  packed_ips = struct.pack("!"+str(len(ns))+"L", *ns)
+  return [socket.inet_ntoa(packed_ips[i:i + 4]) for i in range(0, len(packed_ips), 4)]
 
 def getHostFromIp(ip):
   """Return the reverse DNS of the IP
@@ -51,33 +102,43 @@ def getHostFromIp(ip):
   return: (string) Hostname (empty if no hostname found)
   """
   host = ""
-  str_ip = intToIp(ip)
+  str_ip = socket.inet_ntoa(ip.to_bytes(4, 'big'))
   try:
     host = socket.gethostbyaddr(str_ip)[0]
   except socket.error as e:
     logging.error("No host found for IP "+str_ip+": "+str(e))
   return host
 
+async def getHostsFromIps(ips, concurrency = 128):
+  """Return the reverse DNS of multiple IPs with lookups done at the same time (asyncio)
+
+  Keyword arguments:
+    ips -- ([long, ...]) IP numbers
+    concurrency -- (int, optional) Maximum number of lookups done at the same time
+
+  return: ([string, ...]) Hostname of every IP (empty if no hostname found)
+  """
+  loop = asyncio.get_event_loop()
+  semaphore = asyncio.BoundedSemaphore(concurrency)
+
+  async def limitedGetHost(ip):
+    host = ""
+    str_ip = socket.inet_ntoa(ip.to_bytes(4, 'big'))
+    async with semaphore:
+      try:
+        host = (await loop.getnameinfo((str_ip, 0), socket.NI_NAMEREQD))[0]
+      except socket.error as e:
+        logging.error("No host found for IP "+str_ip+": "+str(e))
+    return host
+
+  return await asyncio.gather(*[limitedGetHost(ip) for ip in ips])
+
 def getValidPublicIpRange():
   """Get list of all valid public IP range
 
-  return: ([[long, long],  (...)]) List of IP range
+  return: ((long, long),  (...)) List of IP range
   """
-  # IP range taken from https://en.wikipedia.org/wiki/Reserved_IP_addresses
-  return [[16777216, 167772159],   # 1.0.0.0 to 9.255.255.255
-          [184549376, 1681915903], # 11.0.0.0 to 100.63.255.255
-          [1686110208, 2130641151],# 100.128.0.0 to 126.255.255
-          [2147483648, 2851995647],# 128.0.0.0 to 169.253.255.255
-          [2852061184, 2886729727],# 169.255.0.0 to 172.15.255.255
-          [2887778304, 3221225471],# 172.32.0.0 to 191.255.255.255
-          [3221225728, 3221225983],# 192.0.1.0 to 192.0.1.255
-          [3221226240, 3227017983],# 192.0.3.0 to 192.88.98.255
-          [3227018240, 3232235519],# 192.88.100.0 to 192.167.255.255
-          [3232301056, 3323068415],# 192.169.0.0 to 198.17.255.255
-          [3323199488, 3325256703],# 198.20.0.0 to 198.51.99.255
-          [3325256960, 3405803775],# 198.51.101.0 to 203.0.112.255
-          [3405804032, 3744923903] # 203.0.114.0 to 223.55.255
-         ]
+  return _PUBLIC_IP_RANGES
 
 def getNumberOfPublicIp():
   """Get the total number of public IP
@@ -87,10 +148,9 @@ def getNumberOfPublicIp():
   #No need to calculate this constant everytime
   return 3689020672
   # Real implementation:
-  #ranges = getValidPublicIpRange()
   #number_of_ip = 0
-  #for range in ranges:
-  #  number_of_ip = number_of_ip + (range[1] - range[0] + 1)
+  #for ip_begin, ip_end in _PUBLIC_IP_RANGES:
+  #  number_of_ip = number_of_ip + (ip_end - ip_begin + 1)
   #return number_of_ip
 
 def getValidPublicIps(ip_begin, ip_end):
@@ -102,47 +162,58 @@ def getValidPublicIps(ip_begin, ip_end):
 
   return: ([[long, long], (...)]) List of public IP range between ip_begin and ip_end
   """
-  valid_ip_ranges = []
-
   if ip_begin > ip_end:
     logging.error("Wrong IP range (IP "+intToIp(ip_end)+" should be before "+intToIp(ip_begin)+")")
-    return valid_ip_ranges
+    return []
+
+  first_bound = bisect.bisect_right(_PUBLIC_IP_BOUNDS, ip_begin)
+  last_bound = bisect.bisect_right(_PUBLIC_IP_BOUNDS, ip_end)
+
+  bounds = list(_PUBLIC_IP_BOUNDS[first_bound:last_bound])
+  if first_bound % 2 == 1:
+    # ip_begin is a public IP
+    bounds.insert(0, ip_begin)
+  if last_bound % 2 == 1:
+    # ip_end is a public IP
+    bounds.append(ip_end + 1)
 
-  for public_range in getValidPublicIpRange():
-    if public_range[0] <= ip_end and public_range[1] >= ip_begin:
-      #IPs have at least one IP in common
-      local_ip_begin = max(ip_begin, public_range[0])
-      local_ip_end = min(ip_end, public_range[1])
-      if local_ip_begin <= local_ip_end:
-        valid_ip_ranges.append([local_ip_begin, local_ip_end])
-  return valid_ip_ranges
+  return [[bounds[i], bounds[i + 1] - 1] for i in range(0, len(bounds), 2)]
+
+def isPublicIp(ip):
+  """Check if an IP is a public IP
+
+  Keyword arguments:
+    ip -- (long) IP number
+
+  return: (bool) IP is public
+  """
+  return bisect.bisect_right(_PUBLIC_IP_BOUNDS, ip) % 2 == 1
 
 def getDividedPublicIpRange(approximated_number_of_range):
   """Get approximately approximated_number_of_range ranges of full public IP of approximatelly the same size
 
+  Note: Ranges are generated one by one (no list of all ranges is created)
+
   Keyword arguments:
     approximated_number_of_range -- (int) Approximate number of range the function should return
-                                          (a value < 100 will not give optimal result)
+                                          (a value < 100 will not give optimal result, a value greater
+                                          than the number of public IP gives ranges of 1 IP)
 
-  return: ([[long, long], (...)]) List of public IP range
+  return: (generator of (long, long)) Public IP ranges
   """
-  public_ip_ranges = getValidPublicIpRange()
-  if approximated_number_of_range <= len(public_ip_ranges):
-    return public_ip_ranges
-
-  ranges = []
-  best_nbr_of_ip_per_range = getNumberOfPublicIp()/approximated_number_of_range
-  for public_ip_range in public_ip_ranges:
-    remaining_ip = public_ip_range[1] - public_ip_range[0] + 1
-    while remaining_ip > 0:
-      if remaining_ip >= best_nbr_of_ip_per_range:
-        ranges.append([public_ip_range[1] - remaining_ip + 1,
-                      public_ip_range[1] - remaining_ip + best_nbr_of_ip_per_range])
-        remaining_ip = remaining_ip - best_nbr_of_ip_per_range
-      else :
-        ranges.append([public_ip_range[1] - remaining_ip + 1, public_ip_range[1]])
-        remaining_ip = 0
-  return ranges
+  if approximated_number_of_range <= len(_PUBLIC_IP_RANGES):
+    yield from _PUBLIC_IP_RANGES
+    return
+
+  # At least 1 IP per range
+  best_nbr_of_ip_per_range = max(1, getNumberOfPublicIp() // approximated_number_of_range)
+  for public_ip_begin, public_ip_end in _PUBLIC_IP_RANGES:
+    nbr_of_full_ranges, nbr_of_remaining_ip = divmod(public_ip_end - public_ip_begin + 1, best_nbr_of_ip_per_range)
+    for range_begin in range(public_ip_begin, public_ip_begin + nbr_of_full_ranges * best_nbr_of_ip_per_range,
+                             best_nbr_of_ip_per_range):
+      yield (range_begin, range_begin + best_nbr_of_ip_per_range - 1)
+    if nbr_of_remaining_ip > 0:
+      yield (public_ip_end - nbr_of_remaining_ip + 1, public_ip_end)
 
 def ping(host, timeout = 2):
   """Ping a server
@@ -155,20 +226,54 @@ def ping(host, timeout = 2):
   """
   is_up = False
 
-  #Ping parameters are function of the OS
-  ping_cmd = "ping -n 1 -w "+str(1000 * timeout)+ " " \
-             +host if platform.system().lower()=="windows" else \
-             "ping -c 1 -W "+str(timeout)+ " "+host
+  ping_cmd = _PING_CMD + [str(_PING_TIMEOUT_FACTOR * timeout), host]
+
+  try:
+    is_up = (subprocess.call(ping_cmd, stdout=subprocess.DEVNULL) == 0)
+  except Exception as e:
+    logging.error("Unexpected error: "+str(e))
+
+  return is_up
+
+async def pingAsync(host, timeout = 2):
+  """Ping a server without blocking the event loop (asyncio)
+
+  Keyword arguments:
+    host -- (string) Host to ping
+    timeout -- (int, optional) Maximum time in sec to wait an answer
+
+  return: (bool) Ping successful
+  """
+  is_up = False
+
+  ping_cmd = _PING_CMD + [str(_PING_TIMEOUT_FACTOR * timeout), host]
 
   try:
-    proc = subprocess.Popen(shlex.split(ping_cmd), stdout=subprocess.PIPE)
-    proc.communicate()
-    is_up = (proc.returncode == 0)
+    proc = await asyncio.create_subprocess_exec(*ping_cmd, stdout=subprocess.DEVNULL)
+    is_up = (await proc.wait() == 0)
   except Exception as e:
     logging.error("Unexpected error: "+str(e))
 
   return is_up
 
+async def pingMany(hosts, timeout = 2, concurrency = 256):
+  """Ping multiple servers at the same time (asyncio)
+
+  Keyword arguments:
+    hosts -- ([string, ...]) Hosts to ping
+    timeout -- (int, optional) Maximum time in sec to wait an answer
+    concurrency -- (int, optional) Maximum number of ping done at the same time
+
+  return: ([bool, ...]) Ping successful (for every host)
+  """
+  semaphore = asyncio.Semaphore(concurrency)
+
+  async def limitedPing(host):
+    async with semaphore:
+      return await pingAsync(host, timeout)
+
+  return await asyncio.gather(*[limitedPing(host) for host in hosts])
+
 def ipLoop(ip_begin, ip_end, check_function):
   """Call a function for all IP in specific range
 
@@ -181,7 +286,6 @@ def ipLoop(ip_begin, ip_end, check_function):
   """
   char_ip_begin = intToIp(ip_begin)
   char_ip_end = intToIp(ip_end)
-  count = 0
 
   if ip_begin > ip_end:
     logging.error("Wrong IP range (IP "+char_ip_begin+" should be before "+char_ip_end+")")
@@ -189,19 +293,45 @@ def ipLoop(ip_begin, ip_end, check_function):
 
   logging.debug("Begin IP loop from "+char_ip_begin+" to "+char_ip_end)
 
-  # xrange was renamed range in python3+
-  try:
-    xrange
-  except NameError:
-    xrange = range
-
-  for ip in xrange(ip_begin, ip_end + 1):
+  for count, ip in enumerate(range(ip_begin, ip_end + 1)):
     check_function(ip, count)
-    count = count + 1
   logging.debug("Loop from "+char_ip_begin+" to "+char_ip_end+" done")
 
   return True
 
+def ipLoopBatched(ip_begin, ip_end, check_function, batch_size = 65536):
+  """Call a function for batches of consecutive IPs in specific range
+
+  Note: Each batch is a range object (no list is created), the function can
+        check all its IPs at once (e.g. with numpy.arange(batch.start, batch.stop))
+
+  Keyword arguments:
+    ip_begin -- (long) First IP for the loop
+    ip_end -- (long) Last IP for the loop
+    check_function -- (function((range)ips, (int)count_of_first_ip)) Function to call for every batch of IPs
+    batch_size -- (int, optional) Maximum number of IPs in a batch
+
+  return: (bool) Parameters are valid
+  """
+  char_ip_begin = intToIp(ip_begin)
+  char_ip_end = intToIp(ip_end)
+
+  if ip_begin > ip_end:
+    logging.error("Wrong IP range (IP "+char_ip_begin+" should be before "+char_ip_end+")")
+    return False
+
+  if batch_size <= 0:
+    logging.error("Wrong batch size ("+str(batch_size)+" should be greater than 0)")
+    return False
+
+  logging.debug("Begin batched IP loop from "+char_ip_begin+" to "+char_ip_end)
+
+  for batch_begin in range(ip_begin, ip_end + 1, batch_size):
+    check_function(range(batch_begin, min(batch_begin + batch_size, ip_end + 1)), batch_begin - ip_begin)
+  logging.debug("Batched loop from "+char_ip_begin+" to "+char_ip_end+" done")
+
+  return True
+
 def main():
   """Demo of the IP utility functions"""
 
@@ -226,26 +356,50 @@ def main():
   ip_long = 2130706433
   print(str(ip_long)+" (long) -> "+str(intToIp(ip_long))+" (IP)")
 
+  print("\n-------------Transform IPs to integers----------------")
+  ips = ["127.0.0.1", "8.8.8.8"]
+  print(str(ips)+" (IP) -> "+str(ipsToInts(ips))+" (long)")
+
+  print("\n-------------Transform integers to IPs----------------")
+  ips_long = [2130706433, 134744072]
+  print(str(ips_long)+" (long) -> "+str(intsToIps(ips_long))+" (IP)")
+
   print("\n----------------Get hostname from IP------------------")
   ip = "8.8.8.8"
   print("Hostname of "+str(ip)+": "+str(getHostFromIp(ipToInt(ip))))
 
+  print("\n------------Get hostnames from IPs at once------------")
+  ips = ["8.8.8.8", "1.1.1.1"]
+  hosts = asyncio.run(getHostsFromIps(ipsToInts(ips)))
+  for ip, host in zip(ips, hosts):
+    print("Hostname of "+str(ip)+": "+str(host))
+
   print("\n--------Get public IPs from specific IP range---------")
   ip_begin = "171.30.0.0"
   ip_end = "192.88.97.255"
   print("List of public IPs between "+ip_begin+" and "+ip_end+": " \
         +str(getValidPublicIps(ipToInt(ip_begin), ipToInt(ip_end))))
 
+  print("\n------------------Check public IPs--------------------")
+  ips = ["8.8.8.8", "10.0.0.1", "192.168.1.1"]
+  for ip in ips:
+    print(ip+" is public: "+str(isPublicIp(ipToInt(ip))))
+
   print("\n---Get public IPs ranges of approximately same size---")
   divided_number = 50
   print("Public IPs divided into approximately "+str(divided_number)+" ranges: " \
-        +str(getDividedPublicIpRange(divided_number)))
+        +str(list(getDividedPublicIpRange(divided_number))))
 
   print("\n-------------------Ping IP or host--------------------")
   ips = ["127.0.0.1", "100.100.100.100", "google.com"]
   for ip in ips:
     print("Ping "+ip+": "+str(ping(ip, 2)))
 
+  print("\n---------------Ping IPs or hosts at once---------------")
+  results = asyncio.run(pingMany(ips, 2))
+  for ip, is_up in zip(ips, results):
+    print("Ping "+ip+": "+str(is_up))
+
   print("\n----------------Loop over an IP range-----------------")
   ip_begin = "11.0.0.250"
   ip_end = "11.0.1.5"
@@ -254,6 +408,12 @@ def main():
 
   ipLoop(ipToInt(ip_begin), ipToInt(ip_end), printTest)
 
+  print("\n-----------Loop over an IP range by batches------------")
+  def printBatchTest(ips, count):
+      print(str(count)+": "+str(intToIp(ips[0]))+" -> "+str(intToIp(ips[-1]))+" ("+str(len(ips))+" IPs)")
+
+  ipLoopBatched(ipToInt(ip_begin), ipToInt(ip_end), printBatchTest, 4)
+
   print("\n----------------------------------------------------")
   print("-------------------End of demo----------------------")
   print("----------------------------------------------------\n")